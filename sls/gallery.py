@@ -1,3 +1,5 @@
+from typing import Callable, List, Optional
+
 from kivy.core.window import Window
 
 from kivy.properties import ObjectProperty
@@ -9,15 +11,61 @@ from kivy.uix.carousel import Carousel
 
 
 class ImageCarousel(ModalView):
+    """A modal view showing a series of images in a carousel.
+
+    Slides get their source only when they become the current slide or one of
+    its neighbours. The source is looked up at that moment with `source_for`,
+    so that a rendition created after the carousel was opened is still used.
+
+    Attributes
+    ----------
+    gallery
+        The Carousel holding the slides.
+    images
+        The images shown in the carousel, one per slide.
+    source_for
+        Function returning the file to load for an image.
+
+    """
+
     gallery: Carousel = ObjectProperty()
+    images: List[str]
+    source_for: Callable[[str], str]
 
-    def __init__(self, images, **kwargs):
+    def __init__(
+        self,
+        images: List[str],
+        source_for: Optional[Callable[[str], str]] = None,
+        **kwargs
+    ):
         super().__init__(**kwargs)
-        for image in images:
-            widget = AsyncImage(source=image)
-            self.gallery.add_widget(widget)
+        self.images = images
+        self.source_for = source_for or (lambda image: image)
+        for _ in images:
+            self.gallery.add_widget(AsyncImage())
+        self.gallery.bind(index=self.on_gallery_index)
+        self.load_slides()
         Window.bind(on_key_down=self.key_action)
 
+    def on_gallery_index(self, gallery, index):
+        self.load_slides()
+
+    def load_slides(self):
+        """Set the source of the current slide and its neighbours.
+
+        Slides whose source has already been set are left alone, because their
+        image may already be loaded.
+
+        """
+        if not self.images:
+            return
+        index = self.gallery.index or 0
+        for offset in (0, 1, -1):
+            i = (index + offset) % len(self.images)
+            slide = self.gallery.slides[i]
+            if not slide.source:
+                slide.source = self.source_for(self.images[i])
+
     def key_action(self, win, keycode, codepoint, text, modifiers):
         if keycode == 275:
             self.gallery.load_next()
@@ -1,6 +1,9 @@
 import os
 import hashlib
 import base64
+import tempfile
+import threading
+import time
 
 from typing import Dict, Optional, Tuple, List
 
@@ -8,6 +11,13 @@ from appdirs import AppDirs
 from PIL import Image as PILImage
 from PIL.ImageOps import exif_transpose
 
+from sls.thumbnail_format import (
+    THUMBNAIL_FORMATS,
+    thumbnail_extension,
+    encode_thumbnail,
+    decode_thumbnail,
+)
+
 
 class ImageLibrary:
     """A directory containing image files.
@@ -21,7 +31,11 @@ class ImageLibrary:
     itself is stored under the entry '.'.
 
     When an ImageLibrary is instantiated, a thumbnail directory is created in the
-    user's cache dir if one does not already exist.
+    user's cache dir if one does not already exist. Thumbnails are stored in
+    this directory under the relative path of their image, with the extension
+    of the thumbnail format appended to it. Screen-sized renditions of the
+    images, used by the image carousel, are stored in the same way in a
+    renditions directory, in a subdirectory named after the rendition size.
 
     Attributes
     ----------
@@ -31,17 +45,33 @@ class ImageLibrary:
         Dictionary of directory paths to their contents.
     app_dirs
         App-specific directories
+    cache_dir
+        File path of the library's cache directory.
     thumbnail_dir
         File path of the thumbnail directory.
+    rendition_dir
+        File path of the directory holding screen-sized renditions.
+    thumbnail_format
+        Format in which thumbnails are stored, one of the keys of
+        `THUMBNAIL_FORMATS`.
+    thumbnail_quality
+        Encoder quality (1-100) for the lossy thumbnail formats.
 
     """
 
     root: str
     contents: Dict[str, Tuple[List[str], List[str]]]
     dirs: AppDirs
+    cache_dir: str
     thumbnail_dir: str
-
-    def __init__(self, root: str):
+    rendition_dir: str
+    thumbnail_format: str
+    thumbnail_quality: int
+    start_time: float
+
+    def __init__(
+        self, root: str, thumbnail_format: str = "jpeg", thumbnail_quality: int = 85
+    ):
         """
         Create an ImageLibrary instance.
 
@@ -49,8 +79,18 @@ class ImageLibrary:
         ----------
         root
             File path of the image directory.
+        thumbnail_format
+            Format in which thumbnails are stored: 'jpeg', 'webp' or 'rgba'.
+        thumbnail_quality
+            Encoder quality (1-100) for the 'jpeg' and 'webp' formats.
         """
 
+        # Raise a ValueError early if the format is unknown.
+        thumbnail_extension(thumbnail_format)
+        self.thumbnail_format = thumbnail_format
+        self.thumbnail_quality = thumbnail_quality
+        self.start_time = time.time()
+
         # Set root, contents and dirs attributes.
         self.root = os.path.expanduser(root)
         self.contents = {}
@@ -60,14 +100,24 @@ class ImageLibrary:
 
         self.app_dirs = AppDirs("sls", "ten.eleven")
 
-        # Set thumbnail_dir attribute.
-        self.thumbnail_dir = os.path.join(
+        # Set cache_dir, thumbnail_dir and rendition_dir attributes.
+        self.cache_dir = os.path.join(
             self.app_dirs.user_cache_dir,
             ImageLibrary.generate_dir_name(self.root),
-            "thumbnails",
         )
+        self.thumbnail_dir = os.path.join(self.cache_dir, "thumbnails")
+        self.rendition_dir = os.path.join(self.cache_dir, "renditions")
         os.makedirs(self.thumbnail_dir, exist_ok=True)
 
+        # The migration marker records the format to which all cached
+        # thumbnails have been migrated. If we are going to create thumbnails
+        # in another format, it no longer holds.
+        if self.migrated_format() != self.thumbnail_format:
+            try:
+                os.remove(self.migration_marker)
+            except FileNotFoundError:
+                pass
+
     def __str__(self):
         result = ""
         for key, val in self.contents.items():
@@ -128,8 +178,10 @@ class ImageLibrary:
     def create_thumbnail(self, image_path: str) -> str:
         """Create a thumbnail for `image` and return its file path.
 
-        If the thumbnail already exists, just return its path. If the thumbnail
-        cannot be created, return the path to the stock image
+        If the thumbnail already exists, just return its path. If a thumbnail
+        in another format or in the old layout exists, it is converted, which is
+        much cheaper than creating the thumbnail from the image. If the
+        thumbnail cannot be created, return the path to the stock image
         'missing_image.png'.
 
         Parameters
@@ -142,28 +194,417 @@ class ImageLibrary:
         Absolute file path of the thumbnail.
 
         """
-        thumbnail_path = os.path.join(self.thumbnail_dir, image_path)
+        thumbnail_path = self.thumbnail_path(image_path)
 
         # https://openclipart.org/detail/298746/missing-image
 
         try:
             if os.path.exists(thumbnail_path):
                 return thumbnail_path
-            with PILImage.open(os.path.join(self.root, image_path)) as image:
-                thumbnail_dir = os.path.dirname(thumbnail_path)
-                if not os.path.exists(thumbnail_dir):
-                    os.makedirs(thumbnail_dir)
-
-                # Transpose the image, because `thumbnail()` doesn't retain
-                # exif-data and thus removes the "Orientation".
-                transposed_image = exif_transpose(image)
-                transposed_image.thumbnail((100, 100))
-                transposed_image.save(thumbnail_path)
+            self.convert_stale_thumbnails(image_path)
+            if os.path.exists(thumbnail_path):
+                return thumbnail_path
+            image = self.scaled_image(image_path, (100, 100))
+            self.save_thumbnail(image, thumbnail_path)
         except OSError:
             thumbnail_path = "resources/missing_image.png"
 
         return thumbnail_path
 
+    def scaled_image(self, image_path: str, size: Tuple[int, int]) -> PILImage.Image:
+        """Open `image_path` and scale it down to fit within `size`.
+
+        JPEG images are decoded at a reduced scale where possible, which is much
+        faster and uses much less memory than decoding them at full size.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Maximum width and height of the scaled image.
+
+        Returns
+        -------
+        The scaled image.
+
+        Raises
+        ------
+        OSError
+            If the image cannot be read.
+
+        """
+        with PILImage.open(os.path.join(self.root, image_path)) as image:
+            # The draft box is square, because the image may still be rotated
+            # by `exif_transpose`.
+            box = 2 * max(size)
+            image.draft("RGB", (box, box))
+
+            # Transpose the image, because `thumbnail()` doesn't retain
+            # exif-data and thus removes the "Orientation".
+            transposed_image = exif_transpose(image)
+            transposed_image.thumbnail(size)
+
+        return transposed_image
+
+    def decoded_size(self, image_path: str, size: Tuple[int, int]) -> int:
+        """Return the number of bytes needed to decode `image_path`.
+
+        This is the memory `scaled_image` needs to hold the decoded image before
+        it is scaled to `size`. Only the image header is read.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Size the image is to be scaled to.
+
+        Returns
+        -------
+        The size of the decoded image in bytes.
+
+        Raises
+        ------
+        OSError
+            If the image cannot be read.
+
+        """
+        with PILImage.open(os.path.join(self.root, image_path)) as image:
+            box = 2 * max(size)
+            image.draft("RGB", (box, box))
+            return image.width * image.height * len(image.getbands())
+
+    def fits_within(self, image_path: str, size: Tuple[int, int]) -> bool:
+        """Return True if `image_path` already fits within `size`.
+
+        The size of the image is taken after applying its EXIF orientation.
+        Only the image header is read.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Maximum width and height.
+
+        Returns
+        -------
+        True if the image is no wider and no higher than `size`.
+
+        Raises
+        ------
+        OSError
+            If the image cannot be read.
+
+        """
+        with PILImage.open(os.path.join(self.root, image_path)) as image:
+            width, height = image.size
+            # Orientations 5 to 8 rotate the image by 90 degrees.
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+
+        return width <= size[0] and height <= size[1]
+
+    def rendition_path(self, image_path: str, size: Tuple[int, int]) -> str:
+        """Return the path of the rendition of `image_path` of size `size`.
+
+        The rendition need not exist. Renditions are stored in the thumbnail
+        format, except when that is 'rgba', which would make screen-sized
+        renditions very large. In that case, 'jpeg' is used.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Maximum width and height of the rendition.
+
+        Returns
+        -------
+        Absolute file path of the rendition.
+
+        """
+        ext = thumbnail_extension(self.rendition_format)
+        return os.path.join(
+            self.rendition_dir, f"{size[0]}x{size[1]}", f"{image_path}.{ext}"
+        )
+
+    @property
+    def rendition_format(self) -> str:
+        """The format in which renditions are stored."""
+        if self.thumbnail_format == "rgba":
+            return "jpeg"
+        return self.thumbnail_format
+
+    def cached_rendition(self, image_path: str, size: Tuple[int, int]) -> Optional[str]:
+        """Return the path of the rendition of `image_path` if it exists.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Maximum width and height of the rendition.
+
+        Returns
+        -------
+        Absolute file path of the rendition, or None if it has not been created.
+
+        """
+        rendition_path = self.rendition_path(image_path, size)
+        if os.path.exists(rendition_path):
+            return rendition_path
+        return None
+
+    def create_rendition(self, image_path: str, size: Tuple[int, int]) -> str:
+        """Create a screen-sized rendition of `image_path` and return its path.
+
+        If the rendition already exists, just return its path. If the image
+        already fits within `size`, no rendition is created, because it would
+        be no smaller than the image and only lose quality. In that case, and if
+        the rendition cannot be created, return the path of the image itself.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        size
+            Maximum width and height of the rendition.
+
+        Returns
+        -------
+        Absolute file path of the rendition.
+
+        """
+        rendition_path = self.rendition_path(image_path, size)
+        if os.path.exists(rendition_path):
+            return rendition_path
+
+        try:
+            if self.fits_within(image_path, size):
+                return os.path.join(self.root, image_path)
+            image = self.scaled_image(image_path, size)
+            self.save_thumbnail(image, rendition_path, self.rendition_format)
+        except OSError:
+            rendition_path = os.path.join(self.root, image_path)
+
+        return rendition_path
+
+    def thumbnail_path(self, image_path: str, fmt: Optional[str] = None) -> str:
+        """Return the path of the thumbnail for `image_path`.
+
+        The thumbnail need not exist.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+        fmt
+            Thumbnail format. Defaults to `self.thumbnail_format`.
+
+        Returns
+        -------
+        Absolute file path of the thumbnail.
+
+        """
+        ext = thumbnail_extension(fmt or self.thumbnail_format)
+        return os.path.join(self.thumbnail_dir, f"{image_path}.{ext}")
+
+    def save_thumbnail(
+        self, image: PILImage.Image, thumbnail_path: str, fmt: Optional[str] = None
+    ):
+        """Save `image` as a thumbnail at `thumbnail_path`.
+
+        The thumbnail is written to a temporary file first, which is then moved
+        into place, so that a thumbnail that is being written by one thread is
+        never read by another one.
+
+        Parameters
+        ----------
+        image
+            The scaled down image.
+        thumbnail_path
+            Absolute file path of the thumbnail.
+        fmt
+            Thumbnail format. Defaults to `self.thumbnail_format`.
+
+        """
+        thumbnail_dir = os.path.dirname(thumbnail_path)
+        os.makedirs(thumbnail_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=thumbnail_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                encode_thumbnail(
+                    image,
+                    tmp_file,
+                    fmt or self.thumbnail_format,
+                    self.thumbnail_quality,
+                )
+            os.replace(tmp_path, thumbnail_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @property
+    def migration_marker(self) -> str:
+        """File path of the migration marker."""
+        return os.path.join(self.cache_dir, "thumbnail_format")
+
+    def migrated_format(self) -> Optional[str]:
+        """Return the format to which the thumbnail cache has been migrated.
+
+        Returns
+        -------
+        The format recorded in the migration marker, or None if there is no
+        marker.
+
+        """
+        try:
+            with open(self.migration_marker) as marker:
+                return marker.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def remove_temp_files(self):
+        """Remove temporary files left behind by an earlier run.
+
+        `save_thumbnail` writes to a temporary file first. If the program is
+        killed while it does so, the temporary file stays in the cache. Only
+        files older than this ImageLibrary are removed, so that files that are
+        still being written are left alone.
+
+        """
+        for directory, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if not file.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, file)
+                try:
+                    if os.path.getmtime(path) < self.start_time:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def migrate_thumbnails(self, stop: Optional[threading.Event] = None) -> int:
+        """Convert cached thumbnails to `self.thumbnail_format`.
+
+        Thumbnails stored in another format, or in the old layout in which the
+        thumbnail had the same name and format as its image, are re-encoded
+        from the cached thumbnail itself and then removed. This is much cheaper
+        than creating the thumbnail anew from the original image. Images that
+        have no cached thumbnail are left alone.
+
+        Temporary files left behind by an earlier run are removed first. When
+        the migration completes, the format is recorded in the migration
+        marker, so that the next run does not have to check every image again.
+
+        Parameters
+        ----------
+        stop
+            If given, the migration stops as soon as this event is set.
+
+        Returns
+        -------
+        The number of thumbnails that were converted.
+
+        """
+        self.remove_temp_files()
+        if self.migrated_format() == self.thumbnail_format:
+            return 0
+
+        converted = 0
+        for directory, (_, files) in self.contents.items():
+            for file in files:
+                if stop is not None and stop.is_set():
+                    return converted
+
+                image_path = os.path.normpath(os.path.join(directory, file))
+                if self.convert_stale_thumbnails(image_path):
+                    converted += 1
+
+        with open(self.migration_marker, "w") as marker:
+            marker.write(self.thumbnail_format)
+
+        return converted
+
+    def convert_stale_thumbnails(self, image_path: str) -> bool:
+        """Convert a stale thumbnail of `image_path` to `self.thumbnail_format`.
+
+        A thumbnail is stale if it is stored in another format, or in the old
+        layout in which the thumbnail had the same name and format as its image.
+        The first readable stale thumbnail is re-encoded, unless a thumbnail in
+        the current format already exists. Stale thumbnails are then removed.
+        Unreadable ones are left alone.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to `self.root`.
+
+        Returns
+        -------
+        True if a thumbnail was converted, False otherwise.
+
+        """
+        target = self.thumbnail_path(image_path)
+        stale = [
+            (None, os.path.join(self.thumbnail_dir, image_path)),
+        ] + [
+            (fmt, self.thumbnail_path(image_path, fmt))
+            for fmt in THUMBNAIL_FORMATS
+            if fmt != self.thumbnail_format
+        ]
+
+        converted = False
+        for fmt, path in stale:
+            if not os.path.isfile(path):
+                continue
+            try:
+                if not os.path.exists(target):
+                    with open(path, "rb") as old_file:
+                        image = decode_thumbnail(old_file, fmt)
+                    self.save_thumbnail(image, target)
+                    converted = True
+                os.remove(path)
+            except OSError:
+                # Leave unreadable thumbnails alone; `create_thumbnail`
+                # regenerates the thumbnail from the image if needed. This also
+                # covers the case where another thread removed the thumbnail
+                # first.
+                pass
+
+        return converted
+
+    def start_thumbnail_migration(
+        self, stop: Optional[threading.Event] = None
+    ) -> threading.Thread:
+        """Run `migrate_thumbnails` in a background thread.
+
+        The thread is a daemon thread, so it does not keep the program alive
+        when the UI is closed. Set `stop` before closing, so that the thread is
+        not killed halfway through writing a thumbnail.
+
+        Parameters
+        ----------
+        stop
+            Event that stops the migration when set.
+
+        Returns
+        -------
+        The started thread.
+
+        """
+        thread = threading.Thread(
+            target=self.migrate_thumbnails,
+            args=(stop,),
+            name="sls-thumbnail-migration",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
     def thumbnail_to_image(self, thumb: str) -> str:
         """Return the path to the full image of a thumbnail.
 
@@ -179,7 +620,8 @@ class ImageLibrary:
 
         path, basename = os.path.split(thumb)
         rel_path = os.path.relpath(path, start=self.thumbnail_dir)
-        return os.path.join(self.root, rel_path, basename)
+        image_name = os.path.splitext(basename)[0]
+        return os.path.join(self.root, rel_path, image_name)
 
     def thumbnail_to_dir(self, thumb: str) -> str:
         """Return the relative directory of a thumbnail.
@@ -1,19 +1,41 @@
 import os.path
-from typing import List
+from functools import partial
+from typing import Dict, List
 
+from kivy.clock import Clock, mainthread
 from kivy.properties import ObjectProperty, ListProperty, StringProperty
 
 from kivy.metrics import dp
 
+from kivy.core.image import ImageData, ImageLoader, ImageLoaderBase
+
 from kivy.uix.recycleview import RecycleView
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.image import Image
 
 from sls.sparsegridlayout import SparseGridLayout, SparseGridEntry
 from sls.image_library import ImageLibrary
+from sls.prefetcher import Prefetcher
+from sls.thumbnail_format import read_raw_thumbnail
 from sls.utils import chunk, prettify_path
 
 
+class ImageLoaderRawThumbnail(ImageLoaderBase):
+    """Image loader for thumbnails stored in the 'rgba' format."""
+
+    @staticmethod
+    def extensions():
+        return ("rgba",)
+
+    def load(self, filename):
+        with open(filename, "rb") as raw_file:
+            width, height, pixels = read_raw_thumbnail(raw_file)
+        return [ImageData(width, height, "rgba", pixels, source=filename)]
+
+
+ImageLoader.register(ImageLoaderRawThumbnail)
+
+
 class SLSImage(ButtonBehavior, SparseGridEntry, Image):
     pass
 
@@ -35,6 +57,7 @@ class SLSFolder(ButtonBehavior, SparseGridEntry, Image):
 
 class SLSFolderRow(SparseGridLayout):
     image_path = StringProperty()
+    folder_path = StringProperty()
 
     def on_image_path(self, instance, value):
         self.clear_widgets()
@@ -44,6 +67,26 @@ class SLSFolderRow(SparseGridLayout):
 
 class ImagePanel(RecycleView):
     library: ImageLibrary = ObjectProperty()
+    prefetcher: Prefetcher = ObjectProperty()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # Folder rows by folder path, so that `set_folder_cover` can find a
+        # row without scanning `self.data`.
+        self.folder_rows: Dict[str, dict] = {}
+
+        # Covers often arrive in quick succession, so the view is refreshed
+        # at most once per frame.
+        self.refresh_trigger = Clock.create_trigger(
+            lambda dt: self.refresh_from_data()
+        )
+
+    def on_scroll_y(self, instance, value):
+        # Scrolling is the main interaction, so predicted prefetch jobs should
+        # wait until it has stopped.
+        if self.prefetcher:
+            self.prefetcher.notify_activity()
 
     def create_image_row(self, images: List[str], cols=3) -> dict:
         """Create a row of images.
@@ -81,6 +124,10 @@ class ImagePanel(RecycleView):
         added to the data property of the ImagePanel so that it can be displayed
         in the widget.
 
+        If the thumbnail does not exist yet, the folder icon is shown empty and
+        the thumbnail is created in the background by the prefetcher. It is
+        filled in by `set_folder_cover` once it is ready.
+
         Parameters
         ----------
         path
@@ -93,13 +140,41 @@ class ImagePanel(RecycleView):
 
         """
         image_path = self.library.first_image(path)
-        thumbnail = self.library.create_thumbnail(image_path)
-        return {
+        thumbnail = self.library.thumbnail_path(image_path)
+        if not os.path.exists(thumbnail):
+            thumbnail = ""
+            self.prefetcher.request_thumbnail(
+                image_path, partial(self.set_folder_cover, path)
+            )
+        row = {
             "widget": "SLSFolderRow",
             "columns": 3,
             "rows": 1,
             "image_path": thumbnail,
+            "folder_path": path,
         }
+        self.folder_rows[path] = row
+        return row
+
+    @mainthread
+    def set_folder_cover(self, path: str, thumbnail: str):
+        """Show `thumbnail` as the cover of the folder row for `path`.
+
+        This is called by the prefetcher when a folder cover requested by
+        `create_folder_row` is ready.
+
+        Parameters
+        ----------
+        path
+            Path of the directory displayed in the folder row.
+        thumbnail
+            Absolute file path of the thumbnail.
+
+        """
+        row = self.folder_rows.get(path)
+        if row is not None:
+            row["image_path"] = thumbnail
+            self.refresh_trigger()
 
     def add_label(self, path: str, main: bool = False):
         label = {
@@ -0,0 +1,452 @@
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from sls.circular_list import CircularList
+from sls.image_library import ImageLibrary
+
+
+THUMBNAIL_SIZE = (100, 100)
+
+RENDITION_SIZES = (1280, 1920, 2560, 3840)
+
+logger = logging.getLogger(__name__)
+
+
+def rendition_size_for(window_size: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    """Return the rendition size to use for a window of size `window_size`.
+
+    Renditions come in a few fixed sizes, so that resizing the window does not
+    invalidate the cache each time. The returned size is never smaller than the
+    window, so a rendition is never shown scaled up.
+
+    Parameters
+    ----------
+    window_size
+        Width and height of the window.
+
+    Returns
+    -------
+    The smallest of `RENDITION_SIZES` that covers the window, as a (width,
+    height) tuple, or None if the window is larger than all of them. In that
+    case, the original images should be shown.
+
+    """
+    for size in RENDITION_SIZES:
+        if size >= max(window_size):
+            return (size, size)
+    return None
+
+
+class Prefetcher:
+    """Warm thumbnails and renditions in the background.
+
+    The prefetcher runs a single worker thread that creates thumbnails and
+    screen-sized renditions before they are needed. There are two kinds of
+    jobs:
+
+    - Requested thumbnails, e.g., folder covers that the UI is waiting for.
+      These are handled first, in the order in which they were requested.
+    - Predicted jobs, derived from the navigation history. The prefetcher keeps
+      the most recently opened folders and the most recent carousel positions
+      in two CircularLists. From these, it predicts which folder covers will be
+      shown next (those of the subfolders and neighbouring folders of the
+      current folder and of recently visited folders) and which images the
+      carousel will show next (the neighbours of the current image, mostly in
+      the direction in which the user is moving). Predicted jobs are only run
+      once the UI has been idle for `idle_delay` seconds.
+
+    Both kinds of jobs are subject to the CPU budget: after each job, the
+    worker sleeps long enough to keep its share of CPU time below
+    `cpu_budget`. Predicted jobs are also subject to a memory threshold: an
+    image that would need more than `memory_budget` bytes to scale down is not
+    warmed, but left for the UI to load when it is actually needed. This is a
+    per-image limit; since there is only one worker, it is also the most the
+    worker holds at any time for predicted jobs. Requested jobs are exempt,
+    because the UI would otherwise have to create them itself.
+
+    Attributes
+    ----------
+    library
+        The ImageLibrary whose images are warmed.
+    rendition_size
+        Maximum width and height of the renditions, or None if no renditions
+        should be created.
+    folder_history
+        The most recently opened folders, the last one being the current one.
+    position_history
+        The most recent carousel positions, as (folder, index) tuples.
+    cpu_budget
+        Fraction of one CPU core the worker may use, between 0 and 1.
+    memory_budget
+        Bytes of decoded image data above which predicted jobs are skipped.
+    idle_delay
+        Seconds without navigation after which the UI is considered idle.
+    neighbours
+        Number of images ahead of the current carousel position to warm.
+    max_folders
+        Maximum number of predicted folders to warm.
+
+    """
+
+    library: ImageLibrary
+    rendition_size: Optional[Tuple[int, int]]
+    folder_history: CircularList
+    position_history: CircularList
+    cpu_budget: float
+    memory_budget: int
+    idle_delay: float
+    neighbours: int
+    max_folders: int
+
+    def __init__(
+        self,
+        library: ImageLibrary,
+        rendition_size: Optional[Tuple[int, int]],
+        history_size: int = 16,
+        cpu_budget: float = 0.25,
+        memory_budget: int = 128 * 1024 * 1024,
+        idle_delay: float = 0.5,
+        neighbours: int = 3,
+        max_folders: int = 6,
+    ):
+        """Create a Prefetcher.
+
+        The worker thread is not started until `start` is called.
+
+        Parameters
+        ----------
+        library
+            The ImageLibrary whose images are warmed.
+        rendition_size
+            Maximum width and height of the renditions, or None if no
+            renditions should be created.
+        history_size
+            Number of folders and carousel positions to remember.
+        cpu_budget
+            Fraction of one CPU core the worker may use, between 0 and 1.
+        memory_budget
+            Bytes of decoded image data above which predicted jobs are skipped.
+        idle_delay
+            Seconds without navigation after which the UI is considered idle.
+        neighbours
+            Number of images ahead of the current carousel position to warm.
+        max_folders
+            Maximum number of predicted folders to warm.
+
+        """
+        assert 0 < cpu_budget <= 1, "The CPU budget must be between 0 and 1."
+        self.library = library
+        self.rendition_size = rendition_size
+        self.folder_history = CircularList(history_size)
+        self.position_history = CircularList(history_size)
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.idle_delay = idle_delay
+        self.neighbours = neighbours
+        self.max_folders = max_folders
+
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._requests: Deque[Tuple[str, Optional[Callable[[str], None]]]] = deque()
+        self._predicted: List[Tuple[str, str]] = []
+        self._last_activity = time.monotonic()
+
+    def start(self):
+        """Start the worker thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="sls-prefetcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread.
+
+        A job that is already running is finished first.
+
+        """
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+
+    def request_thumbnail(
+        self, image_path: str, callback: Optional[Callable[[str], None]] = None
+    ):
+        """Create the thumbnail of `image_path` in the background.
+
+        Requested thumbnails take precedence over predicted jobs and do not wait
+        for the UI to become idle. `callback` is called from the worker thread
+        with the path returned by `ImageLibrary.create_thumbnail`.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to the library root.
+        callback
+            Function to call with the path of the thumbnail.
+
+        """
+        with self._condition:
+            self._requests.append((image_path, callback))
+            self._condition.notify()
+
+    def set_rendition_size(self, rendition_size: Optional[Tuple[int, int]]):
+        """Change the size of the renditions, e.g., after the window was resized.
+
+        Parameters
+        ----------
+        rendition_size
+            Maximum width and height of the renditions, or None if no
+            renditions should be created.
+
+        """
+        with self._condition:
+            if rendition_size != self.rendition_size:
+                self.rendition_size = rendition_size
+                self._predicted = self.predict()
+                self._condition.notify()
+
+    def notify_activity(self):
+        """Record that the user is navigating.
+
+        This postpones predicted jobs until the UI has been idle for
+        `idle_delay` seconds.
+
+        """
+        with self._condition:
+            self._last_activity = time.monotonic()
+
+    def folder_opened(self, folder: str):
+        """Record that `folder` was opened and update the predictions.
+
+        The image panel cannot navigate into subfolders yet, so for now this is
+        only called for the library root, which the panel shows at startup.
+        The folders shown in the carousel are recorded by `carousel_moved`.
+
+        Parameters
+        ----------
+        folder
+            Path of the folder, relative to the library root.
+
+        """
+        folder = os.path.normpath(folder)
+        if folder not in self.library.contents:
+            return
+
+        with self._condition:
+            if not len(self.folder_history) or self.folder_history[-1] != folder:
+                self.folder_history.append(folder)
+            self._last_activity = time.monotonic()
+            self._predicted = self.predict()
+            self._condition.notify()
+
+    def carousel_moved(self, folder: str, image_name: str):
+        """Record that the carousel shows `image_name` and update the predictions.
+
+        Parameters
+        ----------
+        folder
+            Path of the folder containing the image, relative to the library
+            root.
+        image_name
+            File name of the image.
+
+        """
+        folder = os.path.normpath(folder)
+        try:
+            index = self.library.list_images(folder).index(image_name)
+        except (KeyError, ValueError):
+            return
+
+        with self._condition:
+            self.position_history.append((folder, index))
+            if not len(self.folder_history) or self.folder_history[-1] != folder:
+                self.folder_history.append(folder)
+            self._last_activity = time.monotonic()
+            self._predicted = self.predict()
+            self._condition.notify()
+
+    def predict(self) -> List[Tuple[str, str]]:
+        """Return the predicted jobs, most urgent first.
+
+        Each job is a 2-tuple of the job kind ('rendition' or 'thumbnail') and
+        the image path relative to the library root. Renditions for the
+        carousel come first, because the carousel shows full images, which
+        take longer to load than thumbnails. Before the carousel has been
+        opened, the first images of the current folder are predicted, so that
+        the first carousel of a session need not start cold.
+
+        Returns
+        -------
+        The list of jobs.
+
+        """
+        jobs = []
+
+        if len(self.position_history) and self.rendition_size is not None:
+            folder, index = self.position_history[-1]
+            images = self.library.list_images(folder)
+            direction = 1
+            if len(self.position_history) > 1:
+                previous_folder, previous_index = self.position_history[-2]
+                step = (index - previous_index) % len(images)
+                if previous_folder == folder and step > len(images) // 2:
+                    direction = -1
+            offsets = [0]
+            offsets += [direction * n for n in range(1, self.neighbours + 1)]
+            offsets += [-direction]
+            for offset in offsets:
+                image = images[(index + offset) % len(images)]
+                image_path = os.path.normpath(os.path.join(folder, image))
+                jobs.append(("rendition", image_path))
+        elif len(self.folder_history) and self.rendition_size is not None:
+            folder = self.folder_history[-1]
+            for image in self.library.contents[folder][1][: self.neighbours + 1]:
+                image_path = os.path.normpath(os.path.join(folder, image))
+                jobs.append(("rendition", image_path))
+
+        for folder in self.likely_folders():
+            # Only the folder cover, because that is all the image panel shows
+            # of a subfolder.
+            files = self.library.contents[folder][1]
+            if files:
+                image_path = os.path.normpath(os.path.join(folder, files[0]))
+                jobs.append(("thumbnail", image_path))
+
+        # Remove duplicates, e.g., in small folders in which the neighbours of
+        # an image wrap around, but keep the order.
+        return list(dict.fromkeys(jobs))
+
+    def likely_folders(self) -> List[str]:
+        """Return the folders whose covers are most likely to be shown next.
+
+        These are the subfolders of the current folder, its next and previous
+        sibling and the folders visited before it, most recent first.
+
+        Returns
+        -------
+        Paths of the folders, relative to the library root.
+
+        """
+        if not len(self.folder_history):
+            return []
+
+        current = self.folder_history[-1]
+        folders = [
+            os.path.normpath(os.path.join(current, subdir))
+            for subdir in self.library.contents[current][0]
+        ]
+
+        if current != ".":
+            parent = os.path.dirname(current) or "."
+            siblings = self.library.contents[parent][0]
+            i = siblings.index(os.path.basename(current))
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(siblings):
+                    folders.append(os.path.normpath(os.path.join(parent, siblings[j])))
+
+        for n in range(2, len(self.folder_history) + 1):
+            folders.append(self.folder_history[-n])
+
+        folders = [folder for folder in dict.fromkeys(folders) if folder != current]
+        return folders[: self.max_folders]
+
+    def _next_job(self) -> Optional[Tuple[str, str, bool, Optional[Callable]]]:
+        """Wait for the next job and return it.
+
+        The job is returned as a 4-tuple of the job kind, the image path,
+        whether the job was requested and the callback. Must be called with
+        `self._condition` held. Return None if the worker should stop.
+
+        """
+        while not self._stop.is_set():
+            if self._requests:
+                image_path, callback = self._requests.popleft()
+                return ("thumbnail", image_path, True, callback)
+
+            timeout = None
+            if self._predicted:
+                idle = time.monotonic() - self._last_activity
+                if idle >= self.idle_delay:
+                    kind, image_path = self._predicted.pop(0)
+                    return (kind, image_path, False, None)
+                timeout = self.idle_delay - idle
+
+            self._condition.wait(timeout)
+
+        return None
+
+    def _warm(self, kind: str, image_path: str, requested: bool) -> Optional[str]:
+        """Create the thumbnail or rendition of `image_path`.
+
+        Return the path of the result, or None if the job was skipped.
+
+        """
+        # The rendition size may be changed by the UI thread while we work.
+        rendition_size = self.rendition_size
+        if kind == "thumbnail":
+            target = self.library.thumbnail_path(image_path)
+            size = THUMBNAIL_SIZE
+        elif rendition_size is None:
+            return None
+        else:
+            target = self.library.rendition_path(image_path, rendition_size)
+            size = rendition_size
+
+        if kind == "rendition" and not os.path.exists(target):
+            # Images that already fit are shown as they are, so there is nothing
+            # to warm.
+            try:
+                if self.library.fits_within(image_path, size):
+                    return None
+            except OSError:
+                return None
+
+        if not requested and not os.path.exists(target):
+            # `scaled_image` holds the decoded image and its transposed copy.
+            try:
+                needed = 2 * self.library.decoded_size(image_path, size)
+            except OSError:
+                return None
+            if needed > self.memory_budget:
+                return None
+
+        if kind == "thumbnail":
+            return self.library.create_thumbnail(image_path)
+        return self.library.create_rendition(image_path, rendition_size)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+            if job is None:
+                return
+
+            kind, image_path, requested, callback = job
+            start = time.thread_time()
+
+            # A failing job must not kill the worker, because then all later
+            # requests, e.g., folder covers, would never be handled.
+            try:
+                result = self._warm(kind, image_path, requested)
+            except Exception:
+                logger.exception(f"Could not create {kind} for {image_path}.")
+                result = "resources/missing_image.png"
+            if callback is not None and result is not None:
+                try:
+                    callback(result)
+                except Exception:
+                    logger.exception(f"Callback for {image_path} failed.")
+
+            elapsed = time.thread_time() - start
+
+            # Sleep long enough to keep the worker's share of CPU time within
+            # the budget.
+            if self._stop.wait(elapsed * (1 / self.cpu_budget - 1)):
+                return
@@ -1,13 +1,17 @@
 import os.path
+import threading
 
 from kivy.app import App
 
+from kivy.core.window import Window
+
 from kivy.properties import ObjectProperty
 
 from kivy.uix.boxlayout import BoxLayout
 
 from sls.image_library import ImageLibrary
 from sls.image_panel import ImagePanel
+from sls.prefetcher import Prefetcher, rendition_size_for
 from sls.image_carousel import ImageCarousel
 
 
@@ -21,18 +25,28 @@ class SLSView(BoxLayout):
     ----------
     library
         The ImageLibrary instance holding the image data.
+    prefetcher
+        The Prefetcher instance warming thumbnails and renditions.
     view
         The ImagePanel instance displaying the images.
+    migration
+        The thread migrating the thumbnail cache.
+    migration_stop
+        Event that stops the migration when set.
 
     """
 
     library: ImageLibrary = ObjectProperty()
+    prefetcher: Prefetcher = ObjectProperty()
     view: ImagePanel = ObjectProperty()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
         self.library = ImageLibrary("~/src/Python/sls/Pictures")
+        self.prefetcher = Prefetcher(self.library, rendition_size_for(Window.size))
+        self.prefetcher.start()
+        Window.bind(on_resize=self.on_window_resize)
 
         # We pass "" as the `directory` argument of `add_folder`, not '.',
         # because the directory is combined with the names of its subdirs using
@@ -46,6 +60,13 @@ class SLSView(BoxLayout):
         path = os.path.relpath(self.library.root, os.path.expanduser("~"))
         self.view.add_label(path=path, main=True)
         self.view.add_folder("", *self.library.contents["."])
+        self.prefetcher.folder_opened(".")
+
+        # Convert thumbnails left in the cache by an earlier run with another
+        # thumbnail format. This runs in the background, because it may take a
+        # while for large libraries.
+        self.migration_stop = threading.Event()
+        self.migration = self.library.start_thumbnail_migration(self.migration_stop)
 
         # root.ids.app_title.text = self.folder.root
 
@@ -54,7 +75,10 @@ class SLSView(BoxLayout):
 
         The image carousel is opened with the image corresponding to the
         thumbnail as the first image. The other images in the directory
-        containing the thumbnail are part of the carousel.
+        containing the thumbnail are part of the carousel. The carousel asks
+        `carousel_source` for the file to show when a slide comes into view, so
+        that renditions the prefetcher creates while the carousel is open are
+        used as well.
 
         Parameters
         ----------
@@ -63,17 +87,68 @@ class SLSView(BoxLayout):
 
         """
         img_dir = self.library.thumbnail_to_dir(thumbnail_path)
-        img_name = os.path.basename(thumbnail_path)
+        img_name = os.path.basename(self.library.thumbnail_to_image(thumbnail_path))
         img_names = self.library.list_images(img_dir, first=img_name)
-        img_paths = [os.path.join(self.library.root, img_dir, img) for img in img_names]
-        carousel = ImageCarousel(img_paths)
+
+        self.prefetcher.set_rendition_size(rendition_size_for(Window.size))
+        img_paths = [os.path.join(img_dir, img) for img in img_names]
+        carousel = ImageCarousel(img_paths, source_for=self.carousel_source)
+        carousel.gallery.bind(
+            index=lambda gallery, index: self.prefetcher.carousel_moved(
+                img_dir, img_names[index]
+            )
+        )
+        carousel.gallery.bind(
+            on_touch_down=self.on_carousel_touch,
+            on_touch_move=self.on_carousel_touch,
+        )
+        self.prefetcher.carousel_moved(img_dir, img_name)
         carousel.open()
 
+    def carousel_source(self, image_path: str) -> str:
+        """Return the file to show in the carousel for `image_path`.
+
+        This is the cached rendition of the image if there is one, otherwise
+        the image itself. Only renditions that are at least as large as the
+        window are used; a rendition created for a smaller window would be
+        shown scaled up.
+
+        Parameters
+        ----------
+        image_path
+            Path of the image, relative to the library root.
+
+        Returns
+        -------
+        Absolute file path of the rendition or the image.
+
+        """
+        rendition_size = rendition_size_for(Window.size)
+        if rendition_size is not None:
+            rendition = self.library.cached_rendition(image_path, rendition_size)
+            if rendition:
+                return rendition
+        return os.path.join(self.library.root, image_path)
+
+    def on_carousel_touch(self, gallery, touch):
+        # Swiping through the carousel counts as activity, so that predicted
+        # prefetch jobs do not compete with it. Return None so that the
+        # carousel still handles the touch.
+        self.prefetcher.notify_activity()
+
+    def on_window_resize(self, window, width: int, height: int):
+        self.prefetcher.set_rendition_size(rendition_size_for((width, height)))
+
 
 class SLSApp(App):
     def build(self):
         return SLSView()
 
+    def on_stop(self):
+        self.root.migration_stop.set()
+        self.root.prefetcher.stop()
+        self.root.migration.join(timeout=1)
+
 
 if __name__ == "__main__":
     SLSApp().run()
@@ -0,0 +1,129 @@
+"""Compare the thumbnail formats on a directory of images.
+
+For every thumbnail format, and for the original format of each image (which is
+how thumbnails used to be stored), the thumbnails of all images under a
+directory are written to a temporary directory. The report lists the bytes on
+disk and the mean time needed to decode a thumbnail for each format.
+
+Usage:
+
+    python -m sls.thumbnail_benchmark [directory] [quality]
+
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+from typing import Dict, List, Optional
+
+from PIL import Image as PILImage
+from PIL.ImageOps import exif_transpose
+
+from sls.thumbnail_format import (
+    THUMBNAIL_FORMATS,
+    decode_thumbnail,
+    encode_thumbnail,
+)
+
+
+def load_thumbnails(root: str) -> List[PILImage.Image]:
+    """Return thumbnail-sized copies of all images under `root`.
+
+    Files that cannot be read as images are skipped.
+
+    Parameters
+    ----------
+    root
+        Directory to search for images.
+
+    Returns
+    -------
+    The scaled down images, with their original format in the `format`
+    attribute.
+
+    """
+    thumbnails = []
+    for directory, _, files in os.walk(root):
+        for file in files:
+            try:
+                with PILImage.open(os.path.join(directory, file)) as image:
+                    original_format = image.format
+                    transposed_image = exif_transpose(image)
+                    transposed_image.thumbnail((100, 100))
+                    transposed_image.format = original_format
+                    thumbnails.append(transposed_image)
+            except OSError:
+                pass
+
+    return thumbnails
+
+
+def benchmark(
+    thumbnails: List[PILImage.Image], quality: int = 85, repeat: int = 5
+) -> Dict[str, Dict[str, float]]:
+    """Measure the size on disk and the decode time of each thumbnail format.
+
+    Parameters
+    ----------
+    thumbnails
+        The scaled down images to encode.
+    quality
+        Encoder quality for the lossy formats.
+    repeat
+        Number of times each thumbnail is decoded. The fastest run is used.
+
+    Returns
+    -------
+    A dictionary mapping each format onto a dictionary with the total number of
+    bytes on disk ('bytes') and the mean decode time in milliseconds
+    ('decode_ms').
+
+    """
+    results = {}
+    formats: List[Optional[str]] = [None, *THUMBNAIL_FORMATS]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt in formats:
+            total_bytes = 0
+            decode_time = 0.0
+            for index, image in enumerate(thumbnails):
+                path = os.path.join(tmp_dir, f"{index}.thumb")
+                with open(path, "wb") as thumb_file:
+                    if fmt is None:
+                        image.save(thumb_file, image.format)
+                    else:
+                        encode_thumbnail(image, thumb_file, fmt, quality)
+                total_bytes += os.path.getsize(path)
+
+                with open(path, "rb") as thumb_file:
+                    data = thumb_file.read()
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    decode_thumbnail(io.BytesIO(data), fmt)
+                    timings.append(time.perf_counter() - start)
+                decode_time += min(timings)
+
+            results[fmt or "original"] = {
+                "bytes": total_bytes,
+                "decode_ms": 1000 * decode_time / max(len(thumbnails), 1),
+            }
+
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, float]], count: int):
+    print(f"{count} thumbnails")
+    print(f"{'format':<10}{'bytes on disk':>15}{'decode (ms)':>14}")
+    for fmt, result in results.items():
+        print(f"{fmt:<10}{result['bytes']:>15,.0f}{result['decode_ms']:>14.3f}")
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "Pictures"
+    quality = int(sys.argv[2]) if len(sys.argv) > 2 else 85
+    images = load_thumbnails(os.path.expanduser(root))
+    print_report(benchmark(images, quality), len(images))
@@ -0,0 +1,150 @@
+"""Encoding and decoding of thumbnails.
+
+Thumbnails can be stored in one of the formats listed in `THUMBNAIL_FORMATS`.
+JPEG and WebP are lossy and take a `quality` setting between 1 and 100. The
+'rgba' format is an uncompressed dump of the thumbnail's pixels, preceded by a
+small header holding the image dimensions. It takes up the most space on disk
+but needs no decoding at all.
+
+"""
+
+import struct
+
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from PIL import Image as PILImage
+
+
+THUMBNAIL_FORMATS: Dict[str, str] = {
+    "jpeg": "jpg",
+    "webp": "webp",
+    "rgba": "rgba",
+}
+
+RAW_MAGIC = b"SLSR"
+RAW_HEADER = struct.Struct("<4sII")
+
+
+def thumbnail_extension(fmt: str) -> str:
+    """Return the file extension for thumbnail format `fmt`.
+
+    Parameters
+    ----------
+    fmt
+        One of the keys of `THUMBNAIL_FORMATS`.
+
+    Returns
+    -------
+    The file extension, without a leading dot.
+
+    Raises
+    ------
+    ValueError
+        If `fmt` is not a known thumbnail format.
+
+    """
+    try:
+        return THUMBNAIL_FORMATS[fmt]
+    except KeyError:
+        raise ValueError(
+            f"Unknown thumbnail format {fmt!r}; "
+            f"expected one of {', '.join(THUMBNAIL_FORMATS)}."
+        ) from None
+
+
+def has_alpha(image: PILImage.Image) -> bool:
+    """Return True if `image` has an alpha channel or a transparent colour."""
+    return image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+
+
+def encode_thumbnail(
+    image: PILImage.Image, fp: BinaryIO, fmt: str, quality: int = 85
+) -> None:
+    """Write `image` to `fp` in thumbnail format `fmt`.
+
+    Parameters
+    ----------
+    image
+        The (already scaled down) image to write.
+    fp
+        Binary file object to write to.
+    fmt
+        One of the keys of `THUMBNAIL_FORMATS`.
+    quality
+        Encoder quality for the lossy formats. Ignored for 'rgba'.
+
+    """
+    if fmt == "jpeg":
+        # JPEG has no alpha channel, so transparent images are flattened onto
+        # the white background of the image panel.
+        if has_alpha(image):
+            rgba = image.convert("RGBA")
+            background = PILImage.new("RGBA", rgba.size, (255, 255, 255, 255))
+            image = PILImage.alpha_composite(background, rgba)
+        image.convert("RGB").save(fp, "JPEG", quality=quality, optimize=True)
+    elif fmt == "webp":
+        mode = "RGBA" if has_alpha(image) else "RGB"
+        image.convert(mode).save(fp, "WEBP", quality=quality, method=4)
+    elif fmt == "rgba":
+        rgba = image.convert("RGBA")
+        fp.write(RAW_HEADER.pack(RAW_MAGIC, rgba.width, rgba.height))
+        fp.write(rgba.tobytes())
+    else:
+        thumbnail_extension(fmt)
+
+
+def read_raw_thumbnail(fp: BinaryIO) -> Tuple[int, int, bytes]:
+    """Read a thumbnail in the 'rgba' format.
+
+    Parameters
+    ----------
+    fp
+        Binary file object to read from.
+
+    Returns
+    -------
+    A 3-tuple of the width, the height and the RGBA pixel data, stored
+    row by row from the top of the image.
+
+    Raises
+    ------
+    OSError
+        If `fp` does not contain a valid raw thumbnail.
+
+    """
+    header = fp.read(RAW_HEADER.size)
+    if len(header) != RAW_HEADER.size:
+        raise OSError("Truncated raw thumbnail header.")
+    magic, width, height = RAW_HEADER.unpack(header)
+    if magic != RAW_MAGIC:
+        raise OSError("Not a raw thumbnail.")
+    pixels = fp.read(width * height * 4)
+    if len(pixels) != width * height * 4:
+        raise OSError("Truncated raw thumbnail data.")
+
+    return width, height, pixels
+
+
+def decode_thumbnail(fp: BinaryIO, fmt: Optional[str]) -> PILImage.Image:
+    """Read a thumbnail in format `fmt` and return it fully decoded.
+
+    Parameters
+    ----------
+    fp
+        Binary file object to read from.
+    fmt
+        One of the keys of `THUMBNAIL_FORMATS`, or None to let Pillow detect
+        the format.
+
+    Returns
+    -------
+    The decoded image.
+
+    """
+    if fmt == "rgba":
+        width, height, pixels = read_raw_thumbnail(fp)
+        return PILImage.frombytes("RGBA", (width, height), pixels)
+
+    image = PILImage.open(fp)
+    image.load()
+    return image
@@ -0,0 +1,154 @@
+import os
+import threading
+
+import pytest
+from PIL import Image as PILImage
+
+from sls.image_library import ImageLibrary
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "Pictures"
+    (root / "sub").mkdir(parents=True)
+    PILImage.new("RGB", (400, 300), (255, 0, 0)).save(root / "a.jpg")
+    PILImage.new("RGB", (300, 400), (0, 255, 0)).save(root / "sub" / "b.png")
+    return str(root)
+
+
+def write_legacy_thumbnail(library, image_path):
+    path = os.path.join(library.thumbnail_dir, image_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with PILImage.open(os.path.join(library.root, image_path)) as image:
+        image.thumbnail((100, 100))
+        image.save(path)
+    return path
+
+
+def test_create_thumbnail(root):
+    library = ImageLibrary(root)
+    thumbnail = library.create_thumbnail("a.jpg")
+    assert thumbnail == os.path.join(library.thumbnail_dir, "a.jpg.jpg")
+    with PILImage.open(thumbnail) as image:
+        assert image.format == "JPEG"
+        assert image.size == (100, 75)
+    image_path = os.path.normpath(library.thumbnail_to_image(thumbnail))
+    assert image_path == os.path.join(root, "a.jpg")
+
+
+def test_migrate_old_layout(root):
+    library = ImageLibrary(root, thumbnail_format="webp")
+    legacy = write_legacy_thumbnail(library, os.path.join("sub", "b.png"))
+
+    assert library.migrate_thumbnails() == 1
+    assert not os.path.exists(legacy)
+    with PILImage.open(library.thumbnail_path(os.path.join("sub", "b.png"))) as image:
+        assert image.format == "WEBP"
+    assert library.migrated_format() == "webp"
+
+
+def test_migrate_other_format(root):
+    ImageLibrary(root, thumbnail_format="rgba").create_thumbnail("a.jpg")
+    library = ImageLibrary(root, thumbnail_format="jpeg")
+
+    assert library.migrate_thumbnails() == 1
+    assert not os.path.exists(library.thumbnail_path("a.jpg", "rgba"))
+    assert os.path.exists(library.thumbnail_path("a.jpg"))
+
+
+def test_create_thumbnail_converts_stale_thumbnail(root):
+    library = ImageLibrary(root)
+    legacy = write_legacy_thumbnail(library, "a.jpg")
+    os.remove(os.path.join(root, "a.jpg"))
+
+    # The original is gone, so the thumbnail can only come from the cache.
+    assert library.create_thumbnail("a.jpg") == library.thumbnail_path("a.jpg")
+    assert not os.path.exists(legacy)
+
+
+def test_migrate_leaves_unreadable_thumbnail(root):
+    library = ImageLibrary(root)
+    broken = library.thumbnail_path("a.jpg", "rgba")
+    with open(broken, "wb") as broken_file:
+        broken_file.write(b"garbage")
+
+    assert library.migrate_thumbnails() == 0
+    assert os.path.exists(broken)
+    assert not os.path.exists(library.thumbnail_path("a.jpg"))
+
+
+def test_migrate_honours_stop(root):
+    library = ImageLibrary(root)
+    legacy = write_legacy_thumbnail(library, "a.jpg")
+    stop = threading.Event()
+    stop.set()
+
+    assert library.migrate_thumbnails(stop) == 0
+    assert os.path.exists(legacy)
+    assert library.migrated_format() is None
+
+
+def test_migrate_removes_old_temp_files(root):
+    library = ImageLibrary(root)
+    stale = os.path.join(library.thumbnail_dir, "abc.tmp")
+    open(stale, "w").close()
+    os.utime(stale, (library.start_time - 10, library.start_time - 10))
+
+    library.migrate_thumbnails()
+    assert not os.path.exists(stale)
+
+
+def test_marker_removed_on_format_change(root):
+    ImageLibrary(root).migrate_thumbnails()
+    library = ImageLibrary(root, thumbnail_format="webp")
+    assert library.migrated_format() is None
+
+
+@pytest.fixture
+def large_root(root):
+    PILImage.new("RGB", (1600, 1200), (0, 0, 255)).save(
+        os.path.join(root, "large.jpg")
+    )
+    exif = PILImage.Exif()
+    exif[0x0112] = 6  # Rotated by 90 degrees.
+    PILImage.new("RGB", (200, 100), (0, 0, 255)).save(
+        os.path.join(root, "rotated.jpg"), exif=exif.tobytes()
+    )
+    return root
+
+
+def test_create_rendition(large_root):
+    library = ImageLibrary(large_root)
+    assert library.cached_rendition("large.jpg", (400, 400)) is None
+
+    rendition = library.create_rendition("large.jpg", (400, 400))
+    assert rendition == library.rendition_path("large.jpg", (400, 400))
+    assert library.cached_rendition("large.jpg", (400, 400)) == rendition
+    with PILImage.open(rendition) as image:
+        assert image.size == (400, 300)
+
+
+def test_create_rendition_of_image_that_fits(large_root):
+    library = ImageLibrary(large_root)
+    rendition = library.create_rendition("a.jpg", (400, 400))
+    assert rendition == os.path.join(large_root, "a.jpg")
+    assert library.cached_rendition("a.jpg", (400, 400)) is None
+
+
+def test_fits_within_uses_exif_orientation(large_root):
+    library = ImageLibrary(large_root)
+    assert library.fits_within("rotated.jpg", (100, 200))
+    assert not library.fits_within("rotated.jpg", (200, 100))
+
+
+def test_scaled_image_uses_exif_orientation(large_root):
+    library = ImageLibrary(large_root)
+    assert library.scaled_image("rotated.jpg", (50, 50)).size == (25, 50)
+
+
+def test_decoded_size_uses_draft_mode(large_root):
+    library = ImageLibrary(large_root)
+    # The JPEG decoder can scale down by 2, 4 or 8 while decoding.
+    assert library.decoded_size("large.jpg", (100, 100)) == 400 * 300 * 3
+    assert library.decoded_size("large.jpg", (1600, 1600)) == 1600 * 1200 * 3
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image as PILImage
+
+import sls.prefetcher
+from sls.image_library import ImageLibrary
+from sls.prefetcher import Prefetcher, rendition_size_for
+
+
+class StubLibrary:
+    def __init__(self, contents):
+        self.contents = contents
+
+    def list_images(self, directory, first=None):
+        return self.contents[directory][1]
+
+
+def make_prefetcher(**kwargs):
+    library = StubLibrary(
+        {
+            ".": (["A", "B", "C"], ["a", "b", "c", "d", "e", "f"]),
+            "A": (["A1"], ["a1.jpg"]),
+            "A/A1": ([], ["x.jpg", "y.jpg"]),
+            "B": ([], []),
+            "C": ([], ["c1.jpg"]),
+        }
+    )
+    return Prefetcher(library, (1280, 1280), **kwargs)
+
+
+def renditions(jobs):
+    return [path for kind, path in jobs if kind == "rendition"]
+
+
+def thumbnails(jobs):
+    return [path for kind, path in jobs if kind == "thumbnail"]
+
+
+def test_predict_forward():
+    prefetcher = make_prefetcher()
+    prefetcher.carousel_moved(".", "a")
+    prefetcher.carousel_moved(".", "b")
+    assert renditions(prefetcher.predict()) == ["b", "c", "d", "e", "a"]
+
+
+def test_predict_backward():
+    prefetcher = make_prefetcher()
+    prefetcher.carousel_moved(".", "c")
+    prefetcher.carousel_moved(".", "b")
+    assert renditions(prefetcher.predict()) == ["b", "a", "f", "e", "c"]
+
+
+def test_predict_backward_across_wrap_around():
+    prefetcher = make_prefetcher()
+    prefetcher.carousel_moved(".", "a")
+    prefetcher.carousel_moved(".", "f")
+    assert renditions(prefetcher.predict()) == ["f", "e", "d", "c", "a"]
+
+
+def test_predict_removes_duplicates():
+    prefetcher = make_prefetcher()
+    prefetcher.carousel_moved("A/A1", "x.jpg")
+    assert renditions(prefetcher.predict()) == ["A/A1/x.jpg", "A/A1/y.jpg"]
+
+
+def test_predict_seeds_renditions_before_carousel_opens():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened(".")
+    assert renditions(prefetcher.predict()) == ["a", "b", "c", "d"]
+
+
+def test_predict_without_rendition_size():
+    prefetcher = make_prefetcher()
+    prefetcher.carousel_moved(".", "a")
+    prefetcher.set_rendition_size(None)
+    assert renditions(prefetcher.predict()) == []
+
+
+def test_predict_folder_covers():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened(".")
+    # B has no images, so it has no cover to warm.
+    assert thumbnails(prefetcher.predict()) == ["A/a1.jpg", "C/c1.jpg"]
+
+
+def test_likely_folders_subfolders():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened(".")
+    assert prefetcher.likely_folders() == ["A", "B", "C"]
+
+
+def test_likely_folders_siblings_then_history():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened(".")
+    prefetcher.folder_opened("B")
+    assert prefetcher.likely_folders() == ["C", "A", "."]
+
+
+def test_likely_folders_history_most_recent_first():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened(".")
+    prefetcher.folder_opened("C")
+    prefetcher.folder_opened("A/A1")
+    assert prefetcher.likely_folders() == ["C", "."]
+
+
+def test_likely_folders_max_folders():
+    prefetcher = make_prefetcher(max_folders=2)
+    prefetcher.folder_opened(".")
+    assert prefetcher.likely_folders() == ["A", "B"]
+
+
+def test_folder_opened_ignores_unknown_folder():
+    prefetcher = make_prefetcher()
+    prefetcher.folder_opened("nope")
+    assert prefetcher.likely_folders() == []
+
+
+def test_rendition_size_for():
+    assert rendition_size_for((800, 600)) == (1280, 1280)
+    assert rendition_size_for((1920, 1080)) == (1920, 1920)
+    assert rendition_size_for((5120, 2880)) is None
+
+
+class RecordingLibrary(ImageLibrary):
+    def __init__(self, root):
+        super().__init__(root)
+        self.calls = []
+
+    def create_thumbnail(self, image_path):
+        self.calls.append(("thumbnail", image_path))
+        return super().create_thumbnail(image_path)
+
+    def create_rendition(self, image_path, size):
+        self.calls.append(("rendition", image_path))
+        return super().create_rendition(image_path, size)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "Pictures"
+    (root / "sub").mkdir(parents=True)
+    for name in ("a.jpg", "b.jpg", os.path.join("sub", "c.jpg")):
+        PILImage.new("RGB", (400, 300), (255, 0, 0)).save(root / name)
+    return RecordingLibrary(str(root))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.01)
+
+
+def test_requested_jobs_run_first(library):
+    prefetcher = Prefetcher(library, (100, 100), cpu_budget=1, idle_delay=0.01)
+    prefetcher.folder_opened(".")
+    prefetcher.request_thumbnail("sub/c.jpg")
+    prefetcher.start()
+    try:
+        wait_for(lambda: len(library.calls) >= 3)
+    finally:
+        prefetcher.stop()
+
+    assert library.calls[0] == ("thumbnail", "sub/c.jpg")
+    assert ("rendition", "a.jpg") in library.calls[1:]
+
+
+def test_predicted_jobs_wait_for_idle(library):
+    prefetcher = Prefetcher(library, (100, 100), cpu_budget=1, idle_delay=0.3)
+    prefetcher.folder_opened(".")
+    prefetcher.start()
+    try:
+        time.sleep(0.1)
+        assert library.calls == []
+        wait_for(lambda: library.calls)
+    finally:
+        prefetcher.stop()
+
+
+def test_memory_budget_skips_predicted_jobs(library):
+    prefetcher = Prefetcher(library, (100, 100), memory_budget=1)
+    assert prefetcher._warm("rendition", "a.jpg", requested=False) is None
+    assert library.cached_rendition("a.jpg", (100, 100)) is None
+
+    # Requested jobs are exempt.
+    thumbnail = prefetcher._warm("thumbnail", "a.jpg", requested=True)
+    assert thumbnail == library.thumbnail_path("a.jpg")
+
+
+def test_cpu_budget_sleep(library, monkeypatch):
+    clock = iter(range(0, 100, 1))
+    monkeypatch.setattr(sls.prefetcher.time, "thread_time", lambda: next(clock))
+    prefetcher = Prefetcher(library, (100, 100), cpu_budget=0.25)
+
+    waits = []
+
+    class RecordingEvent(threading.Event):
+        def wait(self, timeout=None):
+            waits.append(timeout)
+            self.set()
+            return True
+
+    prefetcher._stop = RecordingEvent()
+    prefetcher.request_thumbnail("a.jpg")
+    prefetcher._run()
+
+    # A job that took one second of CPU time is followed by three seconds of
+    # sleep, to stay within a quarter of a core.
+    assert waits == [3]
+
+
+def test_failing_jobs_do_not_stop_the_worker(library, monkeypatch):
+    def fail(image_path):
+        raise ValueError("Bad EXIF data.")
+
+    def failing_callback(path):
+        raise RuntimeError("Callback failed.")
+
+    monkeypatch.setattr(library, "create_thumbnail", fail)
+    prefetcher = Prefetcher(library, (100, 100), cpu_budget=1)
+    results = []
+    prefetcher.request_thumbnail("a.jpg", results.append)
+    prefetcher.request_thumbnail("b.jpg", failing_callback)
+    prefetcher.request_thumbnail("sub/c.jpg", results.append)
+    prefetcher.start()
+    try:
+        wait_for(lambda: len(results) == 2)
+    finally:
+        prefetcher.stop()
+
+    # The last request was still handled after the two failures.
+    assert results == ["resources/missing_image.png"] * 2
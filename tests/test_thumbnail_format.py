@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+
+from sls.thumbnail_format import (
+    RAW_HEADER,
+    RAW_MAGIC,
+    THUMBNAIL_FORMATS,
+    decode_thumbnail,
+    encode_thumbnail,
+    read_raw_thumbnail,
+    thumbnail_extension,
+)
+
+
+@pytest.mark.parametrize("fmt", THUMBNAIL_FORMATS)
+def test_round_trip(fmt):
+    image = PILImage.new("RGB", (40, 30), (200, 100, 50))
+    fp = io.BytesIO()
+    encode_thumbnail(image, fp, fmt)
+    fp.seek(0)
+    decoded = decode_thumbnail(fp, fmt)
+    assert decoded.size == (40, 30)
+    r, g, b = decoded.convert("RGB").getpixel((20, 15))
+    assert abs(r - 200) <= 8 and abs(g - 100) <= 8 and abs(b - 50) <= 8
+
+
+def test_raw_round_trip_is_exact():
+    image = PILImage.new("RGBA", (3, 2), (1, 2, 3, 4))
+    fp = io.BytesIO()
+    encode_thumbnail(image, fp, "rgba")
+    fp.seek(0)
+    assert read_raw_thumbnail(fp) == (3, 2, bytes([1, 2, 3, 4]) * 6)
+
+
+def test_jpeg_flattens_transparency_onto_white():
+    image = PILImage.new("RGBA", (10, 10), (0, 0, 0, 0))
+    fp = io.BytesIO()
+    encode_thumbnail(image, fp, "jpeg")
+    fp.seek(0)
+    assert decode_thumbnail(fp, "jpeg").getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_raw_truncated_header():
+    with pytest.raises(OSError):
+        read_raw_thumbnail(io.BytesIO(RAW_MAGIC))
+
+
+def test_raw_truncated_data():
+    fp = io.BytesIO(RAW_HEADER.pack(RAW_MAGIC, 2, 2) + b"\0" * 15)
+    with pytest.raises(OSError):
+        read_raw_thumbnail(fp)
+
+
+def test_raw_bad_magic():
+    fp = io.BytesIO(RAW_HEADER.pack(b"XXXX", 1, 1) + b"\0" * 4)
+    with pytest.raises(OSError):
+        read_raw_thumbnail(fp)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        thumbnail_extension("gif")
+
+
+@pytest.mark.parametrize("fmt", ["webp", "rgba"])
+def test_transparent_palette_png_keeps_alpha(fmt):
+    png = io.BytesIO()
+    image = PILImage.new("P", (10, 10), 0)
+    image.putpalette([255, 0, 0, 0, 0, 255])
+    image.putpixel((0, 0), 1)
+    image.save(png, "PNG", transparency=0)
+    png.seek(0)
+
+    fp = io.BytesIO()
+    with PILImage.open(png) as image:
+        encode_thumbnail(image, fp, fmt)
+    fp.seek(0)
+    decoded = decode_thumbnail(fp, fmt).convert("RGBA")
+    assert decoded.getpixel((5, 5))[3] == 0
+    assert decoded.getpixel((0, 0))[3] == 255
+
+
+def test_webp_opaque_palette_image_is_rgb():
+    image = PILImage.new("P", (10, 10), 0)
+    fp = io.BytesIO()
+    encode_thumbnail(image, fp, "webp")
+    fp.seek(0)
+    assert decode_thumbnail(fp, "webp").mode == "RGB"